@@ -1,16 +1,48 @@
 # agent.py
 import os
+import re
 import sys
 import asyncio
 import json
 import traceback
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 
 import httpx
 from dotenv import load_dotenv
 
+# Optional: h2 enables HTTP/2 on httpx clients (pip install httpx[http2])
+try:
+    import h2
+except Exception:
+    h2 = None
+
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse, urlunparse, unquote_plus
+
+# Optional: orjson encodes/decodes JSON several times faster than stdlib json
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# Optional: aioconsole reads stdin on the event loop instead of a worker thread
+try:
+    from aioconsole import ainput
+except Exception:
+    ainput = None
+
+# Optional: tiktoken for token-based history trimming
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+# Optional: selectolax's Lexbor backend parses pages much faster than BeautifulSoup
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except Exception:
+    LexborHTMLParser = None
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
@@ -20,8 +52,9 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.tools import BaseTool
 
 # Import your search + scraper modules
-from web_search import search_all
-from web_scraper import scrape_website, extract_body_content, clean_body_content
+from web_search import search_all_async, close_search_session
+from web_scraper import scrape_website, close_scraper, extract_body_content, clean_body_content, BS4_PARSER
+from semantic_cache import async_cached, query_numbers
 
 # -----------------------------
 # Load Environment Variables
@@ -31,19 +64,23 @@ load_dotenv(dotenv_path=r"D:/projects/trendy_bot/.env")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 
-if not GEMINI_API_KEY:
-    print("ERROR: GEMINI_API_KEY not found in .env or environment.")
-    sys.exit(1)
+def _check_keys():
+    """Exit if a key is missing. Runs from main(), not at import: spawned worker processes
+    (Selenium pool) re-import this script as __mp_main__ and must not repeat these side effects.
+    """
+    if not GEMINI_API_KEY:
+        print("ERROR: GEMINI_API_KEY not found in .env or environment.")
+        sys.exit(1)
 
-if not FIRECRAWL_API_KEY:
-    print("ERROR: FIRECRAWL_API_KEY not found in .env or environment.")
-    sys.exit(1)
+    if not FIRECRAWL_API_KEY:
+        print("ERROR: FIRECRAWL_API_KEY not found in .env or environment.")
+        sys.exit(1)
 
-# Some libs may also read GEMINI_API_KEY from env
-os.environ["GEMINI_API_KEY"] = GEMINI_API_KEY
+    # Some libs may also read GEMINI_API_KEY from env
+    os.environ["GEMINI_API_KEY"] = GEMINI_API_KEY
 
-print("GEMINI key present:", bool(GEMINI_API_KEY))
-print("FIRECRAWL key present:", bool(FIRECRAWL_API_KEY))
+    print("GEMINI key present:", bool(GEMINI_API_KEY))
+    print("FIRECRAWL key present:", bool(FIRECRAWL_API_KEY))
 
 # -----------------------------
 # Robust model selection: try multiple model candidates and pick the first that constructs
@@ -57,14 +94,16 @@ MODEL_CANDIDATES = [c.strip() for c in candidates_env.split(",") if c.strip()]
 if not MODEL_CANDIDATES:
     raise RuntimeError("No model candidates configured in MODEL_NAME_CANDIDATES")
 
-def make_google_model(api_key: str):
+@lru_cache(maxsize=4)
+def make_google_model(api_key: str, model_name: Optional[str] = None):
     """Try to instantiate ChatGoogleGenerativeAI with candidate model IDs.
     Do not perform test generation calls here because different client versions
     accept different message shapes. Only try to construct; if construction
     raises, try next candidate. If all fail, raise with helpful guidance.
+    Pass model_name to try only that ID. Successful results are memoized per arguments.
     """
     last_exc = None
-    for candidate in MODEL_CANDIDATES:
+    for candidate in ([model_name] if model_name else MODEL_CANDIDATES):
         try:
             print(f"Trying Google model candidate: {candidate}")
             model_candidate = ChatGoogleGenerativeAI(
@@ -94,8 +133,30 @@ def make_google_model(api_key: str):
     )
     raise RuntimeError(msg)
 
-# Create the model (will try candidates)
-model = make_google_model(GEMINI_API_KEY)
+# The react agent only depends on the model (built on first use, trying candidates) and the
+# tool objects. Tools are bound to their MCP session, so the cache is keyed on the objects
+# themselves (a new session's tools share names with the old ones). Holding the list keeps
+# those ids from being reused while cached.
+_agent_cache: Dict[str, Any] = {"key": None, "tools": None, "agent": None}
+
+def get_agent(tools: List[Any]):
+    key = tuple(id(t) for t in tools)
+    if _agent_cache["key"] != key:
+        tools = list(tools)
+        _agent_cache.update(key=key, tools=tools, agent=create_react_agent(make_google_model(GEMINI_API_KEY), tools))
+    return _agent_cache["agent"]
+
+# -----------------------------
+# JSON helpers: orjson when installed, stdlib json otherwise
+# -----------------------------
+def _json_loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def _json_dumps(obj: Any, indent: bool = False) -> str:
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option).decode()
+    return json.dumps(obj, indent=2 if indent else None)
 
 # -----------------------------
 # Async HTTP fallback for Firecrawl v2 (/v2/query)
@@ -105,9 +166,19 @@ class FirecrawlHTTPFallback:
 
     def __init__(self, api_key: str):
         self.api_key = api_key
+        # one pooled client for the session so repeat queries skip the TCP/TLS handshake
+        self._client = httpx.AsyncClient(
+            base_url=self.BASE_URL,
+            http2=h2 is not None,
+            timeout=25.0,
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        )
 
+    async def aclose(self):
+        await self._client.aclose()
+
+    @async_cached(ttl=3600, query_param="query_text", scope_fn=query_numbers)
     async def query(self, query_text: str, model: str = "firecrawl-latest", max_output_tokens: int = 600) -> Dict[str, Any]:
-        url = f"{self.BASE_URL}/v2/query"
         prompt = (
             f"Extract the top 6 relevant products for the user query: \"{query_text}\".\n"
             "Prefer results from Amazon India and Flipkart if available. "
@@ -122,29 +193,109 @@ class FirecrawlHTTPFallback:
             "max_output_tokens": max_output_tokens
         }
 
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-
-        async with httpx.AsyncClient(timeout=25.0) as client:
-            resp = await client.post(url, json=payload, headers=headers)
+        resp = await self._client.post("/v2/query", json=payload)
 
         if resp.status_code != 200:
             raise RuntimeError(f"Firecrawl HTTP error: {resp.status_code} {resp.text}")
 
         try:
-            return resp.json()
+            return _json_loads(resp.content)
         except Exception:
             return {"raw_text": resp.text}
 
 # -----------------------------
 # Helper: detect product queries
 # -----------------------------
+PRODUCT_KEYWORDS = frozenset([
+    "laptop", "dress", "shoes", "mobile", "phone", "gpu", "watch",
+    "bag", "tv", "trendy", "fashion", "clothes", "tshirt", "t-shirt", "t shirts", "tshirts",
+    "jeans", "under", "budget", "best", "top", "buy"
+])
+# Substring match like the old any(word in text) check, but in a single regex pass
+_PRODUCT_RE = re.compile("|".join(re.escape(k) for k in sorted(PRODUCT_KEYWORDS, key=len, reverse=True)), re.IGNORECASE)
+
+@lru_cache(maxsize=512)
 def is_product_query(user_input: str) -> bool:
-    keywords = [
-        "laptop", "dress", "shoes", "mobile", "phone", "gpu", "watch",
-        "bag", "tv", "trendy", "fashion", "clothes", "tshirt", "t-shirt", "t shirts", "tshirts",
-        "jeans", "under", "budget", "best", "top", "buy"
-    ]
-    return any(word in user_input.lower() for word in keywords)
+    return bool(_PRODUCT_RE.search(user_input))
+
+# -----------------------------
+# Conversation memory: token-budgeted history + remembered query arguments
+# -----------------------------
+MAX_HISTORY_TOKENS = int(os.getenv("MAX_HISTORY_TOKENS", "3000"))
+
+@lru_cache(maxsize=1)
+def _token_encoder():
+    return tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=1024)
+def count_tokens(text: str) -> int:
+    """Token estimate for history trimming (tiktoken if installed, else ~4 chars/token)."""
+    if tiktoken is not None:
+        try:
+            return len(_token_encoder().encode(text))
+        except Exception:
+            pass
+    return len(text) // 4 + 1
+
+def trim_messages(messages: List[Dict[str, Any]], budget: int = MAX_HISTORY_TOKENS) -> List[Dict[str, Any]]:
+    """Keep the system prompt plus the newest messages that fit in `budget` tokens.
+    The newest message is always kept, even if it alone exceeds the budget.
+    """
+    if len(messages) <= 1:
+        return messages
+    system, rest = messages[0], messages[1:]
+    remaining = budget - count_tokens(str(system.get("content", "")))
+    kept: List[Dict[str, Any]] = []
+    for msg in reversed(rest):
+        cost = count_tokens(str(msg.get("content", "")))
+        if kept and cost > remaining:
+            break
+        kept.append(msg)
+        remaining -= cost
+    return [system] + kept[::-1]
+
+_BUDGET_RE = re.compile(r"\b(?:under|below|less than|within|up ?to|max)\s*(?:rs\.?|inr|₹)?\s*(\d[\d,.]*\s*k?)\b", re.IGNORECASE)
+_ORIGIN_RE = re.compile(r"\b(amazon|flipkart|myntra|ajio|meesho|croma|nykaa)\b", re.IGNORECASE)
+_CATEGORY_RE = re.compile(r"\b(laptop|dress|shoe|mobile|phone|gpu|watch|bag|tv|clothes|t-?shirt|t shirt|jeans)s?\b", re.IGNORECASE)
+
+def update_arg_memory(arg_memory: Dict[str, str], user_input: str) -> Dict[str, str]:
+    """Remember the arguments of product queries (category, budget, store) across turns."""
+    m = _CATEGORY_RE.search(user_input)
+    if m:
+        arg_memory["category"] = m.group(1).lower()
+    m = _BUDGET_RE.search(user_input)
+    if m:
+        arg_memory["budget"] = "under " + m.group(1).replace(" ", "").lower()
+    m = _ORIGIN_RE.search(user_input)
+    if m:
+        arg_memory["origin"] = m.group(1).lower()
+    return arg_memory
+
+def with_arg_memory(messages: List[Dict[str, Any]], arg_memory: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Inject remembered arguments as one compact system note instead of replaying old turns."""
+    if not arg_memory or not messages:
+        return messages
+    note = {"role": "system", "content": "Known shopping context from earlier turns: " + ", ".join(
+        f"{k}={v}" for k, v in arg_memory.items()
+    )}
+    return [messages[0], note] + messages[1:]
+
+# -----------------------------
+# Console input without a thread hop (aioconsole), falling back to a worker thread
+# -----------------------------
+_ainput_ok = ainput is not None
+
+async def read_user_input(prompt: str) -> str:
+    global _ainput_ok
+    if _ainput_ok:
+        try:
+            return await ainput(prompt)
+        except (EOFError, KeyboardInterrupt):
+            raise
+        except Exception:
+            # e.g. Windows consoles where stdin can't be attached to the event loop
+            _ainput_ok = False
+    return await asyncio.to_thread(input, prompt)
 
 # -----------------------------
 # Firecrawl MCP server parameters (npx firecrawl-mcp)
@@ -170,10 +321,10 @@ def extract_agent_text(resp: Any) -> str:
             if "messages" in resp and isinstance(resp["messages"], list) and resp["messages"]:
                 last = resp["messages"][-1]
                 if isinstance(last, dict):
-                    return last.get("content") or last.get("text") or json.dumps(last)
+                    return last.get("content") or last.get("text") or _json_dumps(last)
             if "content" in resp:
                 return resp["content"]
-            return json.dumps(resp, indent=2)
+            return _json_dumps(resp, indent=True)
         if hasattr(resp, "messages"):
             msgs = getattr(resp, "messages")
             if isinstance(msgs, list) and msgs:
@@ -207,7 +358,7 @@ def pretty_print_products(products: Any):
                     break
             if isinstance(products, dict) and "raw_text" in products:
                 try:
-                    parsed = json.loads(products["raw_text"])
+                    parsed = _json_loads(products["raw_text"])
                     products = parsed if isinstance(parsed, list) else [parsed]
                 except Exception:
                     print(products["raw_text"])
@@ -220,7 +371,7 @@ def pretty_print_products(products: Any):
             for idx, item in enumerate(products[:10], start=1):
                 if isinstance(item, str):
                     try:
-                        item = json.loads(item)
+                        item = _json_loads(item)
                     except Exception:
                         print(f"{idx}. {item}")
                         continue
@@ -240,7 +391,7 @@ def pretty_print_products(products: Any):
             print(products)
             return
 
-        print(json.dumps(products, indent=2))
+        print(_json_dumps(products, indent=True))
     except Exception as e:
         print("Error formatting products:", e)
         print(repr(products))
@@ -248,83 +399,204 @@ def pretty_print_products(products: Any):
 # -----------------------------
 # Parse product info from HTML (JSON-LD, meta tags, heuristics)
 # -----------------------------
-def parse_product_page(html: str, url: str) -> Dict[str, Optional[str]]:
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-
-        canonical = None
-        can_tag = soup.find("link", rel="canonical")
-        if can_tag and can_tag.get("href"):
-            canonical = urljoin(url, can_tag["href"])
-        else:
-            canonical = url
-
-        def meta_prop(prop_names):
-            for p in prop_names:
-                tag = soup.find("meta", property=p) or soup.find("meta", attrs={"name": p})
-                if tag:
-                    content = tag.get("content")
-                    if content:
-                        return content.strip()
-            return None
-
-        og_title = meta_prop(["og:title", "twitter:title", "title"])
-        og_image = meta_prop(["og:image", "twitter:image", "image"])
-        og_price = meta_prop(["product:price:amount", "og:price:amount", "price", "twitter:data1"])
-
-        title_tag = soup.title.string.strip() if soup.title and soup.title.string else None
-
-        name = None
-        price = None
-        image = None
+def _ld_items(data):
+    """Top-level JSON-LD entities, plus one level of @graph nesting."""
+    for it in (data if isinstance(data, list) else [data]):
+        if not isinstance(it, dict):
+            continue
+        yield it
+        graph = it.get("@graph")
+        if isinstance(graph, list):
+            yield from (g for g in graph if isinstance(g, dict))
+
+def _ld_price(offers) -> Optional[str]:
+    if isinstance(offers, list):
+        offers = offers[0] if offers else None
+    if not isinstance(offers, dict):
+        return None
+    price_val = offers.get("price")
+    spec = offers.get("priceSpecification")
+    if not price_val and isinstance(spec, dict):
+        price_val = spec.get("price")
+    if not price_val:
+        return None
+    currency = offers.get("priceCurrency") or offers.get("currency")
+    return f"{price_val} {currency}" if currency else str(price_val)
+
+def _ld_fields(it: Dict[str, Any]) -> Dict[str, Any]:
+    img = it.get("image")
+    return {
+        "name": it.get("name"),
+        "price": _ld_price(it.get("offers")),
+        "image": (img[0] if img else None) if isinstance(img, list) else img,
+    }
+
+def _extract_product_jsonld(ld_texts) -> Optional[Dict[str, Any]]:
+    """name/price/image of the first named Product entity in the JSON-LD blobs, all from that one
+    entity (listing pages carry several Products). Later blobs are never decoded once it's found.
+    """
+    unnamed = None
+    for text in ld_texts:
+        if not text:
+            continue
         try:
-            for script in soup.find_all("script", type="application/ld+json"):
-                text = script.string
-                if not text:
-                    continue
-                try:
-                    data = json.loads(text.strip())
-                except Exception:
-                    continue
-
-                items = data if isinstance(data, list) else [data]
-                for it in items:
-                    it_type = it.get("@type") or it.get("type")
-                    if isinstance(it_type, list):
-                        it_type = it_type[0]
-                    if it_type and str(it_type).lower() == "product":
-                        if not name:
-                            name = it.get("name")
-                        offers = it.get("offers")
-                        if offers:
-                            if isinstance(offers, list):
-                                offers = offers[0]
-                            price_val = offers.get("price") or (offers.get("priceSpecification") or {}).get("price")
-                            if price_val:
-                                price = str(price_val)
-                            currency = offers.get("priceCurrency") or offers.get("currency")
-                            if currency and price:
-                                price = f"{price} {currency}"
-                        img = it.get("image")
-                        if img:
-                            if isinstance(img, list):
-                                image = img[0]
-                            else:
-                                image = img
-                        if name:
-                            break
+            data = _json_loads(text.strip())
         except Exception:
-            pass
+            continue
 
+        for it in _ld_items(data):
+            it_type = it.get("@type") or it.get("type")
+            if isinstance(it_type, list):
+                it_type = it_type[0] if it_type else None
+            if not it_type or str(it_type).lower() != "product":
+                continue
+            if it.get("name"):
+                return _ld_fields(it)
+            if unnamed is None:
+                unnamed = it
+    if unnamed is None:
+        return None
+    found = _ld_fields(unnamed)
+    return found if any(found.values()) else None
+
+def _node_text(tree, selector: str) -> Optional[str]:
+    node = tree.css_first(selector)
+    return (node.text(strip=True) or None) if node else None
+
+def _canonical_href_lexbor(tree) -> Optional[str]:
+    can_tag = tree.css_first('link[rel~="canonical"]')
+    return can_tag.attributes.get("href") if can_tag else None
+
+# Fast paths for the sites most results come from: a few direct selectors on their stable
+# product-page DOM. Each returns None when the page doesn't match, so the generic
+# JSON-LD + meta walk still runs.
+def _parse_amazon(tree) -> Optional[Dict[str, Optional[str]]]:
+    name = _node_text(tree, "#productTitle")
+    price = _node_text(tree, "span.a-price-whole")
+    if not (name and price):
+        return None
+    img = tree.css_first("#landingImage, #imgBlkFront")
+    image = (img.attributes.get("data-old-hires") or img.attributes.get("src")) if img else None
+    return {"name": name, "price": "₹" + price.rstrip("."), "image": image}
+
+def _parse_flipkart(tree) -> Optional[Dict[str, Optional[str]]]:
+    name = _node_text(tree, "span.B_NuCI, span.VU-ZEz, h1.yhB1nd")
+    price = _node_text(tree, "div._30jeq3, div.Nx9bqj")
+    if not (name and price):
+        return None
+    img = tree.css_first("img._396cs4, img.DByuf4, img._53J4C-")
+    return {"name": name, "price": price, "image": img.attributes.get("src") if img else None}
+
+PARSERS = {
+    "amazon.in": _parse_amazon,
+    "flipkart.com": _parse_flipkart,
+}
+
+def _site_parser(url: str):
+    host = urlparse(url).netloc.lower().split(":")[0]
+    for prefix in ("www.", "m."):
+        host = host.removeprefix(prefix)
+    return PARSERS.get(host)
+
+def _page_parts_lexbor(tree):
+    """Canonical href, {meta key: content}, <title> text and JSON-LD blobs from a Lexbor tree."""
+    canonical_href = _canonical_href_lexbor(tree)
+
+    meta_map: Dict[str, str] = {}
+    for m in tree.css("meta"):
+        key = m.attributes.get("property") or m.attributes.get("name")
+        content = m.attributes.get("content")
+        if key and content:
+            meta_map.setdefault(key.lower(), content.strip())
+
+    title_node = tree.css_first("title")
+    title_tag = title_node.text(strip=True) if title_node else None
+
+    ld_texts = [s.text() for s in tree.css('script[type="application/ld+json"]')]
+    return canonical_href, meta_map, title_tag or None, ld_texts
+
+def _page_parts_bs4(html: str):
+    soup = BeautifulSoup(html, BS4_PARSER)
+
+    can_tag = soup.find("link", rel="canonical")
+    canonical_href = can_tag.get("href") if can_tag else None
+
+    meta_map: Dict[str, str] = {}
+    for m in soup.find_all("meta"):
+        key = m.get("property") or m.get("name")
+        content = m.get("content")
+        if key and content:
+            meta_map.setdefault(key.lower(), content.strip())
+
+    title_tag = soup.title.string.strip() if soup.title and soup.title.string else None
+
+    ld_texts = [script.string for script in soup.find_all("script", type="application/ld+json")]
+    return canonical_href, meta_map, title_tag, ld_texts
+
+def _make_resolver(
+    title_names=("og:title", "twitter:title", "title"),
+    image_names=("og:image", "twitter:image", "image"),
+    price_names=("product:price:amount", "og:price:amount", "price", "twitter:data1"),
+):
+    """Build the JSON-LD -> meta -> <title> field resolution once, with the meta key
+    tuples bound as closure constants instead of rebuilt on every page.
+    """
+    def resolve(meta_map: Dict[str, str], ld: Dict[str, Any], title_tag: Optional[str]):
+        name = ld.get("name")
         if not name:
-            name = og_title or title_tag
-        if not image:
-            image = og_image
+            name = next((meta_map[k] for k in title_names if k in meta_map), None) or title_tag
+        price = ld.get("price")
         if not price:
-            price = og_price
-
+            price = next((meta_map[k] for k in price_names if k in meta_map), None)
+        image = ld.get("image")
+        if not image:
+            image = next((meta_map[k] for k in image_names if k in meta_map), None)
         if isinstance(image, list):
             image = image[0] if image else None
+        return name, price, image
+    return resolve
+
+_resolve_fields = _make_resolver()
+
+def parse_product_page(html: str, url: str) -> Dict[str, Optional[str]]:
+    try:
+        tree = None
+        if LexborHTMLParser is not None:
+            try:
+                tree = LexborHTMLParser(html)
+            except Exception:
+                tree = None
+
+        site_parser = _site_parser(url) if tree is not None else None
+        if site_parser is not None:
+            try:
+                fast = site_parser(tree)
+            except Exception:
+                fast = None
+            if fast:
+                canonical_href = _canonical_href_lexbor(tree)
+                return {
+                    "name": fast["name"],
+                    "price": fast["price"],
+                    "link": urljoin(url, canonical_href) if canonical_href else url,
+                    "image": fast["image"],
+                    "source_url": url,
+                    "raw_title": _node_text(tree, "title"),
+                }
+
+        parts = None
+        if tree is not None:
+            try:
+                parts = _page_parts_lexbor(tree)
+            except Exception:
+                parts = None
+        if parts is None:
+            parts = _page_parts_bs4(html)
+        canonical_href, meta_map, title_tag, ld_texts = parts
+
+        canonical = urljoin(url, canonical_href) if canonical_href else url
+
+        name, price, image = _resolve_fields(meta_map, _extract_product_jsonld(ld_texts) or {}, title_tag)
 
         return {
             "name": name,
@@ -340,164 +612,273 @@ def parse_product_page(html: str, url: str) -> Dict[str, Optional[str]]:
 # -----------------------------
 # Fetch products by searching+scraping
 # -----------------------------
-async def fetch_products_via_scrape(query: str, num_results: int = 6) -> List[Dict[str, Optional[str]]]:
-    try:
-        candidates = await asyncio.to_thread(search_all, query, "", num_results)
-    except Exception as e:
-        print("Error running search_all:", e)
-        candidates = []
+# Shared connection pool for product-page fetches; pages that come back too small
+# or non-200 (JS-rendered / bot walls) fall through to the browser scraper.
+MIN_HTML_BYTES = 1024
+# Stop downloading once a Product JSON-LD block has closed; past this size without one, read the whole page
+STREAM_CEILING_BYTES = 256 * 1024
+_LD_PRODUCT_RE = re.compile(rb'"@type"\s*:\s*\[?\s*"Product"')
+
+_scrape_client: Optional[httpx.AsyncClient] = None
+
+def _get_scrape_client() -> httpx.AsyncClient:
+    """Created on first use (not at import) and again after main() has closed it."""
+    global _scrape_client
+    if _scrape_client is None or _scrape_client.is_closed:
+        _scrape_client = httpx.AsyncClient(
+            http2=h2 is not None,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            timeout=20.0,
+            headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"},
+        )
+    return _scrape_client
+
+async def _stream_product_html(client: httpx.AsyncClient, url: str) -> Optional[str]:
+    """GET url, returning None on non-200. Reading stops early once the page's
+    Product JSON-LD script is complete, since everything parse_product_page needs is above it.
+    """
+    async with client.stream("GET", url, follow_redirects=True) as r:
+        if r.status_code != 200:
+            return None
+        buf = bytearray()
+        product_end = -1
+        async for chunk in r.aiter_bytes(8192):
+            scan_from = max(0, len(buf) - 64)
+            buf.extend(chunk)
+            if product_end < 0:
+                if len(buf) - len(chunk) > STREAM_CEILING_BYTES:
+                    continue
+                m = _LD_PRODUCT_RE.search(buf, scan_from)
+                if not m:
+                    continue
+                product_end = m.end()
+            if buf.find(b"</script>", product_end) != -1:
+                break
+        return bytes(buf).decode(r.encoding or "utf-8", errors="replace")
 
-    products: List[Dict[str, Optional[str]]] = []
-    for url in candidates:
+async def _fetch_and_parse(client: httpx.AsyncClient, url: str) -> Optional[Dict[str, Optional[str]]]:
+    try:
+        html = ""
         try:
-            scraped = await asyncio.to_thread(scrape_website, url)
+            fetched = await _stream_product_html(client, url)
+            if fetched and len(fetched) >= MIN_HTML_BYTES:
+                html = fetched
+        except httpx.HTTPError as e:
+            print(f"Async fetch failed for {url}: {e}")
+
+        if not html:
+            scraped = await scrape_website(url)
             if isinstance(scraped, dict):
                 html = scraped.get("html") or ""
             else:
                 html = scraped or ""
-            if not html:
-                continue
-            parsed = parse_product_page(html, url)
-            if not parsed.get("link"):
-                parsed["link"] = url
-            products.append(parsed)
-        except Exception as e:
-            print(f"Error scraping/parsing {url}: {e}")
+        if not html:
+            return None
+
+        parsed = parse_product_page(html, url)
+        if not parsed.get("link"):
+            parsed["link"] = url
+        return parsed
+    except Exception as e:
+        print(f"Error scraping/parsing {url}: {e}")
+        return None
+
+# Click/ad ids that never change the page, on any host (plus every utm_* param)
+_TRACKING_PARAMS = frozenset(["gclid", "fbclid", "msclkid", "srsltid"])
+# Amazon/Flipkart search-session params; elsewhere names like "store" or "sr" can select content
+_MARKETPLACE_TRACKING_PARAMS = frozenset([
+    "tag", "ref", "ref_", "psc", "qid", "sr",
+    "smid", "spla", "_encoding", "th", "lid", "marketplace", "store", "srno", "otracker", "otracker1",
+    "fm", "iid", "ppt", "ppn", "ssid", "qh", "crid", "sprefix", "dib", "dib_tag",
+    "pd_rd_w", "pd_rd_r", "pd_rd_wg", "pf_rd_p", "pf_rd_r", "content-id",
+])
+
+def _is_marketplace(host: str) -> bool:
+    host = host.split(":", 1)[0]
+    return host == "flipkart.com" or host.endswith(".flipkart.com") or "amazon" in host.split(".")
+
+def _strip_tracking(query: str, marketplace: bool) -> str:
+    """Drop tracking params; the kept ones stay byte-for-byte as they were (no re-encoding)."""
+    parts = [part for part in query.split("&") if part]
+    kept = []
+    for part in parts:
+        key = unquote_plus(part.split("=", 1)[0]).lower()
+        if key.startswith("utm_") or key in _TRACKING_PARAMS:
             continue
+        if marketplace and key in _MARKETPLACE_TRACKING_PARAMS:
+            continue
+        kept.append(part)
+    return query if len(kept) == len(parts) else "&".join(kept)
+
+def _canon(u: str) -> str:
+    p = urlparse(u)
+    netloc = p.netloc.lower()
+    marketplace = _is_marketplace(netloc)
+    path = p.path
+    # amazon appends /ref=sr_1_3 style segments to the product path
+    ref_at = path.find("/ref=") if marketplace else -1
+    if ref_at != -1:
+        path = path[:ref_at]
+    return urlunparse((p.scheme.lower(), netloc, path, p.params, _strip_tracking(p.query, marketplace), ""))
+
+@async_cached(ttl=3600, scope_fn=query_numbers)
+async def fetch_products_via_scrape(query: str, num_results: int = 6) -> List[Dict[str, Optional[str]]]:
+    try:
+        candidates = await search_all_async(query, "", num_results)
+    except Exception as e:
+        print("Error running search_all:", e)
+        candidates = []
+
+    # SERPs often return the same product under several tracking variants
+    candidates = list(dict.fromkeys(_canon(u) for u in candidates if u))
+
+    async with asyncio.TaskGroup() as tg:
+        client = _get_scrape_client()
+        tasks = [tg.create_task(_fetch_and_parse(client, url)) for url in candidates]
 
-    return products
+    return [t.result() for t in tasks if t.result()]
 
 # -----------------------------
 # Main Async Agent Loop
 # -----------------------------
 async def main():
+    _check_keys()
     fallback = FirecrawlHTTPFallback(FIRECRAWL_API_KEY)
 
-    async with stdio_client(server_params) as (read, write):
-        async with ClientSession(read, write) as session:
-            tools = await load_mcp_tools(session)
+    try:
+        async with stdio_client(server_params) as (read, write):
+            async with ClientSession(read, write) as session:
+                tools = await load_mcp_tools(session)
 
-            try:
-                available_tool_names = [getattr(t, "name", str(t)) for t in tools]
-            except Exception:
-                available_tool_names = [str(t) for t in tools]
-            print("Available tools:", available_tool_names)
-            print("-" * 60)
+                try:
+                    available_tool_names = [getattr(t, "name", str(t)) for t in tools]
+                except Exception:
+                    available_tool_names = [str(t) for t in tools]
+                print("Available tools:", available_tool_names)
+                print("-" * 60)
 
-            agent = create_react_agent(model, tools)
+                agent = get_agent(tools)
 
-            messages = [
-                {"role": "system", "content": (
-                    "You are a helpful assistant that can fetch trending products with links, "
-                    "scrape websites using Firecrawl, and provide trend summaries."
-                )}
-            ]
+                messages = [
+                    {"role": "system", "content": (
+                        "You are a helpful assistant that can fetch trending products with links, "
+                        "scrape websites using Firecrawl, and provide trend summaries."
+                    )}
+                ]
 
-            firecrawl_tool = None
-            for t in tools:
-                try:
-                    name = getattr(t, "name", "") or getattr(t, "_name", "") or str(t)
-                    if isinstance(name, str) and ("search_products" in name or ("search" in name and "product" in name)):
-                        firecrawl_tool = t
-                        break
-                except Exception:
-                    continue
+                arg_memory: Dict[str, str] = {}
 
-            while True:
-                user_input = await asyncio.to_thread(input, "\nYou: ")
-                if user_input is None:
-                    continue
-                if user_input.strip().lower() == "quit":
-                    print("Byee")
-                    break
+                firecrawl_tool = None
+                for t in tools:
+                    try:
+                        name = getattr(t, "name", "") or getattr(t, "_name", "") or str(t)
+                        if isinstance(name, str) and ("search_products" in name or ("search" in name and "product" in name)):
+                            firecrawl_tool = t
+                            break
+                    except Exception:
+                        continue
 
-                if len(messages) > 40:
-                    messages = [messages[0]] + messages[-20:]
+                while True:
+                    user_input = await read_user_input("\nYou: ")
+                    if user_input is None:
+                        continue
+                    if user_input.strip().lower() == "quit":
+                        print("Byee")
+                        break
 
-                if is_product_query(user_input):
-                    print("\n(Detected product query — fetching products...)")
-                    products = None
+                    if is_product_query(user_input):
+                        update_arg_memory(arg_memory, user_input)
+                        print("\n(Detected product query — fetching products...)")
+                        products = None
+
+                        # 1) Try MCP tool (preferred)
+                        if firecrawl_tool is not None:
+                            try:
+                                if hasattr(firecrawl_tool, "arun"):
+                                    products = await firecrawl_tool.arun(user_input)
+                                elif hasattr(firecrawl_tool, "_arun"):
+                                    products = await firecrawl_tool._arun(user_input)
+                                elif hasattr(firecrawl_tool, "run"):
+                                    products = await asyncio.to_thread(firecrawl_tool.run, user_input)
+                                else:
+                                    products = await asyncio.to_thread(lambda q: firecrawl_tool(q), user_input)
+                            except Exception as e:
+                                print("MCP tool call failed:", repr(e))
+                                products = None
+
+                        # 2) If MCP tool not available or failed, try HTTP fallback (v2 /v2/query)
+                        if not products:
+                            try:
+                                products = await fallback.query(user_input, max_output_tokens=600)
+                            except Exception as e:
+                                print("HTTP fallback failed:", e)
+                                products = None
 
-                    # 1) Try MCP tool (preferred)
-                    if firecrawl_tool is not None:
+                        # 3) If still nothing or to enrich, use search+scrape DOM extraction
                         try:
-                            if hasattr(firecrawl_tool, "arun"):
-                                products = await firecrawl_tool.arun(user_input)
-                            elif hasattr(firecrawl_tool, "_arun"):
-                                products = await firecrawl_tool._arun(user_input)
-                            elif hasattr(firecrawl_tool, "run"):
-                                products = await asyncio.to_thread(firecrawl_tool.run, user_input)
+                            need_scrape = False
+                            if not products:
+                                need_scrape = True
                             else:
-                                products = await asyncio.to_thread(lambda q: firecrawl_tool(q), user_input)
+                                if isinstance(products, dict):
+                                    found_list = False
+                                    for key in ("items", "results", "products", "hits", "data"):
+                                        if key in products and isinstance(products[key], list) and products[key]:
+                                            found_list = True
+                                            break
+                                    if not found_list:
+                                        need_scrape = True
+                                elif isinstance(products, list) and not products:
+                                    need_scrape = True
+                                elif isinstance(products, str):
+                                    if len(products) < 10:
+                                        need_scrape = True
+
+                            if need_scrape:
+                                scraped_products = await fetch_products_via_scrape(user_input, num_results=6)
+                                if scraped_products:
+                                    products = scraped_products
                         except Exception as e:
-                            print("MCP tool call failed:", repr(e))
-                            products = None
+                            print("Scrape fallback failed:", e)
+
+                        # add the user's query to conversation so the agent can summarize
+                        messages.append({"role": "user", "content": f"Summarize trending products and recommendations for: {user_input}"})
 
-                    # 2) If MCP tool not available or failed, try HTTP fallback (v2 /v2/query)
-                    if not products:
                         try:
-                            products = await fallback.query(user_input, max_output_tokens=600)
+                            messages = trim_messages(messages)
+                            resp = await agent.ainvoke({"messages": with_arg_memory(messages, arg_memory)})
+                            ai_summary = extract_agent_text(resp)
                         except Exception as e:
-                            print("HTTP fallback failed:", e)
-                            products = None
+                            ai_summary = f"Error generating AI summary: {e}"
 
-                    # 3) If still nothing or to enrich, use search+scrape DOM extraction
-                    try:
-                        need_scrape = False
-                        if not products:
-                            need_scrape = True
-                        else:
-                            if isinstance(products, dict):
-                                found_list = False
-                                for key in ("items", "results", "products", "hits", "data"):
-                                    if key in products and isinstance(products[key], list) and products[key]:
-                                        found_list = True
-                                        break
-                                if not found_list:
-                                    need_scrape = True
-                            elif isinstance(products, list) and not products:
-                                need_scrape = True
-                            elif isinstance(products, str):
-                                if len(products) < 10:
-                                    need_scrape = True
-
-                        if need_scrape:
-                            scraped_products = await fetch_products_via_scrape(user_input, num_results=6)
-                            if scraped_products:
-                                products = scraped_products
-                    except Exception as e:
-                        print("Scrape fallback failed:", e)
-
-                    # add the user's query to conversation so the agent can summarize
-                    messages.append({"role": "user", "content": f"Summarize trending products and recommendations for: {user_input}"})
+                        print("\n--- Trend Summary & Top Products ---")
+                        print(ai_summary)
+                        print("\n🔗 Products with links:")
+                        pretty_print_products(products)
+                        continue
 
+                    # Non-product queries: forward to agent
+                    messages.append({"role": "user", "content": user_input[:175000]})
                     try:
-                        resp = await agent.ainvoke({"messages": messages})
-                        ai_summary = extract_agent_text(resp)
-                    except Exception as e:
-                        ai_summary = f"Error generating AI summary: {e}"
-
-                    print("\n--- Trend Summary & Top Products ---")
-                    print(ai_summary)
-                    print("\n🔗 Products with links:")
-                    pretty_print_products(products)
-                    continue
-
-                # Non-product queries: forward to agent
-                messages.append({"role": "user", "content": user_input[:175000]})
-                try:
-                    response = await agent.ainvoke({"messages": messages})
-                    if isinstance(response, dict) and "messages" in response and isinstance(response["messages"], list):
-                        last_msg = response["messages"][-1]
-                        if isinstance(last_msg, dict):
-                            ai_text = last_msg.get("content") or last_msg.get("text") or str(last_msg)
+                        messages = trim_messages(messages)
+                        response = await agent.ainvoke({"messages": with_arg_memory(messages, arg_memory)})
+                        if isinstance(response, dict) and "messages" in response and isinstance(response["messages"], list):
+                            last_msg = response["messages"][-1]
+                            if isinstance(last_msg, dict):
+                                ai_text = last_msg.get("content") or last_msg.get("text") or str(last_msg)
+                            else:
+                                ai_text = getattr(last_msg, "content", str(last_msg))
                         else:
-                            ai_text = getattr(last_msg, "content", str(last_msg))
-                    else:
-                        ai_text = extract_agent_text(response)
-                    print("\nAgent:", ai_text)
-                except Exception as e:
-                    print(f"Error invoking agent: {e}")
+                            ai_text = extract_agent_text(response)
+                        print("\nAgent:", ai_text)
+                    except Exception as e:
+                        print(f"Error invoking agent: {e}")
+    finally:
+        await fallback.aclose()
+        if _scrape_client is not None:
+            await _scrape_client.aclose()
+        await close_scraper()
+        await close_search_session()
 
 
 # -----------------------------
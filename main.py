@@ -1,7 +1,7 @@
 # main.py
 import streamlit as st
 from web_search import main as search_top, search_all
-from web_scraper import scrape_website, extract_body_content, clean_body_content
+from web_scraper import scrape_website_sync, extract_clean_text
 
 st.set_page_config(page_title="Trendy Bot", layout="wide")
 st.title("Trendy Bot")
@@ -37,9 +37,8 @@ if st.button("Search & Scrape"):
 
             try:
                 with st.spinner(f"Scraping {url_to_scrape} ..."):
-                    dom_content = scrape_website(url_to_scrape)
-                    body_content = extract_body_content(dom_content)
-                    cleaned_content = clean_body_content(body_content)
+                    dom_content = scrape_website_sync(url_to_scrape)
+                    cleaned_content = extract_clean_text(dom_content)
 
                 st.session_state.dom_content = cleaned_content
                 with st.expander("View DOM Content"):
@@ -0,0 +1,227 @@
+# semantic_cache.py
+import os
+import time
+import asyncio
+import hashlib
+import re
+import inspect
+import importlib.util
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Optional: diskcache keeps entries across runs (pip install diskcache)
+try:
+    import diskcache
+except Exception:
+    diskcache = None
+
+# Optional: numpy + sentence-transformers enable near-duplicate (semantic) matching.
+# Both are only located here and imported on first use (sentence-transformers pulls in torch,
+# which takes seconds), so importing this module stays cheap.
+def _has_module(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except Exception:
+        return False
+
+HAS_NUMPY = _has_module("numpy")
+HAS_SENTENCE_TRANSFORMERS = _has_module("sentence_transformers")
+np = None  # imported by SemanticCache._embed
+
+CACHE_DIR = os.getenv("TRENDY_CACHE_DIR", "./.trendy_cache")
+EMBEDDING_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+def normalize_query(query: str) -> str:
+    return " ".join(str(query).lower().split())
+
+# Numbers ("under 50k", "iphone 15") barely move a query's embedding, so callers put them in the
+# scope: a semantic hit then never crosses a different price limit or model number
+_NUMBER_RE = re.compile(r"\d[\d,.]*\s*k?\b", re.IGNORECASE)
+
+def query_numbers(query: str) -> str:
+    return ",".join(m.group(0).replace(",", "").replace(" ", "").lower() for m in _NUMBER_RE.finditer(str(query)))
+
+def cache_key(query: str, scope: str = "") -> str:
+    raw = f"{scope}\x00{normalize_query(query)}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+@functools.lru_cache(maxsize=2)
+def _get_encoder(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+class SemanticCache:
+    """
+    Query -> result cache with a TTL.
+    Exact (normalized) queries hit the store directly; otherwise, if an embedding model is
+    available, the closest cached query in the same scope is reused when its cosine
+    similarity is >= threshold. Entries live in diskcache when installed, else in memory.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = CACHE_DIR,
+        ttl: float = 3600,
+        threshold: float = 0.92,
+        max_entries: int = 1024,
+        model_name: str = EMBEDDING_MODEL,
+        embedding_dtype: str = "float32",
+    ):
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.model_name = model_name
+        # "float16" halves the index memory; cosine scores stay well within threshold precision
+        self.embedding_dtype = embedding_dtype
+        self._disk = diskcache.Cache(directory) if (directory and diskcache is not None) else None
+        self._mem: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # scope -> (cache keys, unit-norm embedding rows), in insertion order
+        self._index: Dict[str, Tuple[List[str], Any]] = {}
+        self._lock = threading.Lock()
+        self._encoder_failed = False
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return HAS_NUMPY and HAS_SENTENCE_TRANSFORMERS and not self._encoder_failed
+
+    def _embed(self, query: str):
+        global np
+        if not self.semantic_enabled:
+            return None
+        if np is None:
+            import numpy as np
+        try:
+            vec = _get_encoder(self.model_name).encode(normalize_query(query), normalize_embeddings=True)
+        except Exception as e:
+            print("⚠️ Semantic cache matching disabled (embedding model failed):", e)
+            self._encoder_failed = True
+            return None
+        return np.asarray(vec, dtype=self.embedding_dtype)
+
+    def _read(self, key: str) -> Any:
+        if self._disk is not None:
+            return self._disk.get(key)
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._mem[key]
+                return None
+            self._mem.move_to_end(key)
+            return value
+
+    def _write(self, key: str, value: Any):
+        if self._disk is not None:
+            self._disk.set(key, value, expire=self.ttl)
+            return
+        with self._lock:
+            self._mem[key] = (time.monotonic() + self.ttl, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _drop_index_row(self, scope: str, key: str):
+        with self._lock:
+            keys, embs = self._index.get(scope, ([], None))
+            if key in keys:
+                i = keys.index(key)
+                self._index[scope] = (keys[:i] + keys[i + 1:], np.delete(embs, i, axis=0))
+
+    def lookup(self, query: str, scope: str = "") -> Tuple[Any, Any]:
+        """(value or None, query embedding or None). Hand the embedding to set() on a miss
+        so the query isn't encoded twice."""
+        key = cache_key(query, scope)
+        value = self._read(key)
+        if value is not None:
+            return value, None
+
+        with self._lock:
+            keys, embs = self._index.get(scope, ([], None))
+        if not keys:
+            return None, None
+        q = self._embed(query)
+        if q is None:
+            return None, None
+
+        sims = embs @ q
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None, q
+        value = self._read(keys[best])
+        if value is None:
+            # the matched entry expired or was evicted; forget its embedding too
+            self._drop_index_row(scope, keys[best])
+        return value, q
+
+    def get(self, query: str, scope: str = "") -> Any:
+        return self.lookup(query, scope)[0]
+
+    def set(self, query: str, value: Any, scope: str = "", embedding: Any = None):
+        key = cache_key(query, scope)
+        self._write(key, value)
+
+        q = embedding if embedding is not None else self._embed(query)
+        if q is None:
+            return
+        with self._lock:
+            keys, embs = self._index.get(scope, ([], None))
+            if key in keys:
+                return
+            keys = (keys + [key])[-self.max_entries:]
+            embs = (q[None, :] if embs is None else np.vstack([embs, q]))[-self.max_entries:]
+            self._index[scope] = (keys, embs)
+
+def async_cached(
+    cache: Optional[SemanticCache] = None,
+    *,
+    ttl: float = 3600,
+    query_param: str = "query",
+    scope_fn: Optional[Callable[[str], str]] = None,
+):
+    """
+    Cache an async function's result on its `query_param` argument.
+    Other arguments (except `self`) become part of the scope, so e.g. different
+    num_results values never share an entry; so does scope_fn(query), for parts of the query
+    that embeddings barely see (like a price limit). Empty/None results are not cached.
+    """
+    def decorator(fn):
+        sig = inspect.signature(fn)
+        state = {"cache": cache}
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if state["cache"] is None:
+                state["cache"] = SemanticCache(ttl=ttl)
+            c = state["cache"]
+
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            arguments.pop("self", None)
+            query = arguments.pop(query_param)
+            scope = f"{fn.__qualname__}:{sorted(arguments.items())!r}"
+            if scope_fn is not None:
+                scope = f"{scope}:{scope_fn(query)}"
+
+            try:
+                hit, embedding = await asyncio.to_thread(c.lookup, query, scope)
+            except Exception as e:
+                print("⚠️ Cache lookup failed:", e)
+                hit = embedding = None
+            if hit is not None:
+                return hit
+
+            result = await fn(*args, **kwargs)
+            if result:
+                try:
+                    await asyncio.to_thread(c.set, query, result, scope, embedding)
+                except Exception as e:
+                    print("⚠️ Cache store failed:", e)
+            return result
+
+        return wrapper
+    return decorator
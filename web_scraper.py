@@ -1,15 +1,56 @@
 # web_scraper.py
 import os
+import re
 import time
-import requests
+import asyncio
+import httpx
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
 load_dotenv()
-# Selenium imports
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
+
+# Optional: h2 enables HTTP/2 on the Firecrawl client (pip install httpx[http2])
+try:
+    import h2
+except Exception:
+    h2 = None
+
+# Playwright is the default browser fallback (pip install playwright && playwright install chromium)
+try:
+    from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+except Exception:
+    async_playwright = None
+    PlaywrightTimeoutError = None
+
+# Selenium is only used when USE_SELENIUM=1 (or Playwright is not installed)
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+except Exception:
+    webdriver = None
+
+# BeautifulSoup backend: lxml (libxml2, C) when installed, else the pure-Python html.parser
+try:
+    import lxml
+    BS4_PARSER = "lxml"
+except Exception:
+    BS4_PARSER = "html.parser"
+
+# Optional: selectolax's Lexbor backend for fast text extraction (pip install selectolax)
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except Exception:
+    LexborHTMLParser = None
+
+# Optional: numba JIT for the line-cleaning pass on large pages (pip install numba numpy)
+try:
+    import numpy as np
+    from numba import njit
+except Exception:
+    np = None
+    njit = None
 
 # Optional: validators to check URL shape (pip install validators)
 try:
@@ -21,6 +62,11 @@ FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 FIRECRAWL_API_BASE = "https://api.firecrawl.com/v2/scrape"
 
 CHROMEDRIVER_PATH = "chromedriver.exe"  # adjust path if necessary
+USE_SELENIUM = os.getenv("USE_SELENIUM", "").strip().lower() in ("1", "true", "yes")
+PAGE_TIMEOUT_MS = 15000
+# After DOMContentLoaded, give client-side rendering this long to settle. Shop pages keep polling
+# (ads, telemetry) and may never reach network idle, so this stays short
+IDLE_WAIT_MS = 2000
 
 def normalize_url(url: str) -> str | None:
     if not url:
@@ -32,14 +78,26 @@ def normalize_url(url: str) -> str | None:
         u = "https://" + u
     return u
 
-def scrape_with_firecrawl(url: str) -> str | None:
+# Pooled Firecrawl client, created on first use and dropped by close_scraper()
+_fc_client = None
+
+def _get_fc_client() -> httpx.AsyncClient:
+    global _fc_client
+    if _fc_client is None or _fc_client.is_closed:
+        _fc_client = httpx.AsyncClient(
+            http2=h2 is not None,
+            timeout=30,
+            headers={"Authorization": f"Bearer {FIRECRAWL_API_KEY}", "Content-Type": "application/json"},
+        )
+    return _fc_client
+
+async def scrape_with_firecrawl(url: str) -> str | None:
     """Try Firecrawl API first (if key is present). Returns HTML string or None."""
     if not FIRECRAWL_API_KEY:
         return None
     try:
-        headers = {"Authorization": f"Bearer {FIRECRAWL_API_KEY}", "Content-Type": "application/json"}
         payload = {"url": url, "formats": ["html"], "options": {"stealth": True, "timeout": 20}}
-        resp = requests.post(FIRECRAWL_API_BASE, json=payload, headers=headers, timeout=30)
+        resp = await _get_fc_client().post(FIRECRAWL_API_BASE, json=payload)
         resp.raise_for_status()
         data = resp.json()
         html = (
@@ -53,6 +111,8 @@ def scrape_with_firecrawl(url: str) -> str | None:
 
 def scrape_with_selenium(url: str, headless: bool = True, wait_seconds: float = 3.0) -> str:
     """Selenium fallback. Returns page_source (HTML)."""
+    if webdriver is None:
+        raise RuntimeError("Selenium is not installed (pip install selenium).")
     options = Options()
     if headless:
         # new headless flag for modern Chrome versions
@@ -74,9 +134,97 @@ def scrape_with_selenium(url: str, headless: bool = True, wait_seconds: float =
         except Exception:
             pass
 
-def scrape_website(url: str) -> str:
+# Selenium runs in worker processes so ChromeDriver's blocking I/O and file handles stay out of
+# the event loop's process. Only the URL and the HTML string cross the process boundary.
+# With the spawn start method (Windows, macOS) each worker also re-imports the __main__ script,
+# so entry scripts keep their side effects (key checks, clients, model setup) out of import time.
+SELENIUM_WORKERS = 2
+_selenium_pool = None
+
+def _get_selenium_pool() -> ProcessPoolExecutor:
+    global _selenium_pool
+    if _selenium_pool is None:
+        _selenium_pool = ProcessPoolExecutor(max_workers=SELENIUM_WORKERS)
+    return _selenium_pool
+
+class PlaywrightPool:
+    """
+    One long-lived headless Chromium shared by every scrape on the current event loop.
+    Each fetch gets its own browser context (tab); at most max_pages render at once.
+    """
+
+    def __init__(self, max_pages: int = 4, timeout_ms: int = PAGE_TIMEOUT_MS):
+        self.max_pages = max_pages
+        self.timeout_ms = timeout_ms
+        self._playwright = None
+        self._browser = None
+        self._lock = None
+        self._sem = None
+
+    async def _get_browser(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+        return self._browser
+
+    async def fetch(self, url: str) -> str:
+        """Waits for DOMContentLoaded, then at most IDLE_WAIT_MS for network idle, instead of a fixed sleep."""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_pages)
+        async with self._sem:
+            browser = await self._get_browser()
+            ctx = await browser.new_context()
+            try:
+                page = await ctx.new_page()
+                try:
+                    await page.goto(url, wait_until="domcontentloaded", timeout=self.timeout_ms)
+                    await page.wait_for_load_state("networkidle", timeout=IDLE_WAIT_MS)
+                except PlaywrightTimeoutError:
+                    # pages with long-polling never go idle; take whatever has rendered so far
+                    pass
+                return await page.content()
+            finally:
+                await ctx.close()
+
+    async def close(self):
+        try:
+            if self._browser is not None:
+                await self._browser.close()
+            if self._playwright is not None:
+                await self._playwright.stop()
+        finally:
+            self._playwright = None
+            self._browser = None
+            self._lock = None
+            self._sem = None
+
+_pool = PlaywrightPool(max_pages=int(os.getenv("PLAYWRIGHT_MAX_PAGES", "4")))
+
+async def scrape_with_playwright(url: str) -> str:
+    """Playwright fallback. Returns rendered HTML from the shared browser pool."""
+    return await _pool.fetch(url)
+
+async def close_scraper():
+    """Shut down the shared browser, Selenium workers and Firecrawl client. Call once before the event loop exits."""
+    global _fc_client, _selenium_pool
+    try:
+        if _fc_client is not None:
+            await _fc_client.aclose()
+    finally:
+        _fc_client = None
+        if _selenium_pool is not None:
+            _selenium_pool.shutdown(wait=False, cancel_futures=True)
+            _selenium_pool = None
+        await _pool.close()
+
+async def scrape_website(url: str) -> str:
     """
-    Top-level scraper: validate & normalize URL, then try Firecrawl, else Selenium.
+    Top-level scraper: validate & normalize URL, then try Firecrawl, else a headless browser
+    (Playwright, or Selenium when USE_SELENIUM is set).
     Raises ValueError if url is invalid/unusable.
     Returns HTML string.
     """
@@ -93,30 +241,124 @@ def scrape_website(url: str) -> str:
             raise ValueError(f"Normalized URL does not appear valid: {url_norm}")
 
     # Try Firecrawl first
-    html = scrape_with_firecrawl(url_norm)
+    html = await scrape_with_firecrawl(url_norm)
     if html:
         print("✅ Got HTML from Firecrawl")
         return html
     else:
-        print("⚠️ Firecrawl did not return HTML or not available. Falling back to Selenium.")
+        print("⚠️ Firecrawl did not return HTML or not available. Falling back to headless browser.")
+
+    # Browser fallback
+    if USE_SELENIUM or async_playwright is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_selenium_pool(), scrape_with_selenium, url_norm)
+    return await scrape_with_playwright(url_norm)
 
-    # Selenium fallback
-    html = scrape_with_selenium(url_norm)
-    return html
+def scrape_website_sync(url: str) -> str:
+    """Blocking wrapper for callers without an event loop (e.g. the Streamlit app)."""
+    async def _run():
+        try:
+            return await scrape_website(url)
+        finally:
+            await close_scraper()
+    return asyncio.run(_run())
 
 # small helpers for post-processing
 def extract_body_content(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, BS4_PARSER)
     body = soup.body
     return str(body) if body else ""
 
-def clean_body_content(body_content: str) -> str:
-    soup = BeautifulSoup(body_content, "html.parser")
-    for tag in soup(["script", "style"]):
+def _body_text_lexbor(html: str, drop_tags) -> str:
+    tree = LexborHTMLParser(html)
+    for tag in tree.css(", ".join(drop_tags)):
         tag.decompose()
-    text = soup.get_text(separator="\n")
-    text = "\n".join(line.strip() for line in text.splitlines() if line.strip())
-    return text
+    root = tree.body or tree.root
+    return root.text(separator="\n") if root else ""
+
+def _body_text_bs4(html: str, drop_tags) -> str:
+    soup = BeautifulSoup(html, BS4_PARSER)
+    body = soup.body or soup
+    for tag in body(list(drop_tags)):
+        tag.decompose()
+    return body.get_text(separator="\n")
+
+def _body_text(html: str, drop_tags) -> str:
+    if LexborHTMLParser is not None:
+        try:
+            return _body_text_lexbor(html, drop_tags)
+        except Exception:
+            pass
+    return _body_text_bs4(html, drop_tags)
+
+def clean_body_content(body_content: str) -> str:
+    return _strip_blank_lines(_body_text(body_content, ("script", "style")))
+
+def extract_clean_text(html: str) -> str:
+    """extract_body_content + clean_body_content in a single parse of the page."""
+    return _strip_blank_lines(_body_text(html, ("script", "style", "noscript", "iframe")))
+
+# Below this size the JIT call overhead isn't worth it
+JIT_MIN_CHARS = 64 * 1024
+# Non-ASCII whitespace / line breaks other than NBSP; the kernel doesn't know them, so text
+# containing any of these goes through the str.splitlines path instead
+_KERNEL_UNSAFE_RE = re.compile("[\x85\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]")
+
+if njit is not None:
+    @njit(cache=True)
+    def _is_line_break(c):
+        return c == 10 or c == 11 or c == 12 or c == 13 or c == 28 or c == 29 or c == 30
+
+    @njit(cache=True)
+    def _is_blank(c):
+        return c == 32 or c == 9 or c == 31
+
+    @njit(cache=True)
+    def _strip_blank_lines_kernel(buf):
+        """UTF-8 bytes in, bytes out: each line trimmed (ASCII whitespace and NBSP),
+        blank lines dropped, joined with '\n'. Output is never longer than the input.
+        """
+        n = buf.shape[0]
+        out = np.empty(n, np.uint8)
+        k = 0
+        i = 0
+        while i < n:
+            j = i
+            while j < n and not _is_line_break(buf[j]):
+                j += 1
+            s = i
+            e = j
+            while s < e:
+                if _is_blank(buf[s]):
+                    s += 1
+                elif buf[s] == 0xC2 and s + 1 < e and buf[s + 1] == 0xA0:
+                    s += 2
+                else:
+                    break
+            while e > s:
+                if _is_blank(buf[e - 1]):
+                    e -= 1
+                elif buf[e - 1] == 0xA0 and e - 2 >= s and buf[e - 2] == 0xC2:
+                    e -= 2
+                else:
+                    break
+            if e > s:
+                if k > 0:
+                    out[k] = 10
+                    k += 1
+                out[k:k + (e - s)] = buf[s:e]
+                k += e - s
+            i = j + 1
+        return out[:k]
+
+def _strip_blank_lines(text: str) -> str:
+    if njit is not None and len(text) >= JIT_MIN_CHARS and (text.isascii() or not _KERNEL_UNSAFE_RE.search(text)):
+        try:
+            buf = np.frombuffer(text.encode("utf-8", "surrogatepass"), dtype=np.uint8)
+            return _strip_blank_lines_kernel(buf).tobytes().decode("utf-8", "surrogatepass")
+        except Exception:
+            pass
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
 
 def split_dom_content(dom_content: str, max_length: int = 6000):
     return [dom_content[i : i + max_length] for i in range(0, len(dom_content), max_length)]
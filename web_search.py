@@ -1,25 +1,345 @@
 # web_search.py
 import os
-import requests
+import json
+import time
+import asyncio
+import logging
+import threading
+import itertools
+import concurrent.futures
+import importlib.util
+from collections import OrderedDict, deque
 import urllib.parse
-from typing import List, Optional
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional, Tuple
 
-load_dotenv()
+from semantic_cache import SemanticCache, query_numbers
+
+def _has_module(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except Exception:
+        return False
+
+# httpx (with h2 for HTTP/2) and aiohttp are located here but imported on first use: together
+# they are most of this module's import time, and many callers only ever hit the cache
+HAS_H2 = _has_module("h2")
+HAS_AIOHTTP = _has_module("aiohttp")
+httpx = None  # imported by _get_fc_client
+aiohttp = None  # imported by _get_aio_session
+
+# Optional: selectolax's Lexbor backend for the DuckDuckGo result links (pip install selectolax)
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except Exception:
+    LexborHTMLParser = None
+
+# Optional: lxml.html for direct XPath extraction of result links (pip install lxml)
+try:
+    import lxml.html as lxml_html
+except Exception:
+    lxml_html = None
+
+# Optional: orjson decodes Firecrawl responses straight from bytes, several times faster than json
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# Optional: ijson stream-parses Firecrawl responses so only the first num_results URLs are kept
+try:
+    import ijson
+except Exception:
+    ijson = None
+
+# Optional: cachetools' TTLCache for the search result cache (a small built-in one is used otherwise)
+try:
+    from cachetools import TTLCache
+except Exception:
+    TTLCache = None
+
+logger = logging.getLogger(__name__)
+
+# skip reading .env when the environment already provides the key (containers, CI)
+if os.getenv("FIRECRAWL_API_KEY") is None:
+    from dotenv import load_dotenv
+    load_dotenv()
 
 FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 # NOTE: adjust base if your Firecrawl account uses a different host
 FIRECRAWL_SEARCH_URL = "https://api.firecrawl.com/v2/search"
+# built once; empty when the key is missing (the search functions bail out before using it)
+_FC_HEADERS = (
+    {"Authorization": f"Bearer {FIRECRAWL_API_KEY}", "Content-Type": "application/json"}
+    if FIRECRAWL_API_KEY else {}
+)
+
+def _site_query(query: str, site: str = "") -> str:
+    return f"site:{site} {query}" if site else query
+
+# guards the lazy creation of _SESSION and _FC_CLIENT from search_all's worker threads
+_CLIENT_LOCK = threading.Lock()
+
+# Shared keep-alive session for DuckDuckGo, with a couple of quick retries.
+# raise_on_status=False hands the final 429/5xx back to the callers' own status handling.
+# Built on first use, like _FC_CLIENT (requests/urllib3 are the next-largest import).
+_SESSION = None
+
+def _get_session():
+    global _SESSION
+    with _CLIENT_LOCK:
+        if _SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=20,
+                max_retries=Retry(
+                    total=2,
+                    backoff_factor=0.3,
+                    status_forcelist=[429, 502, 503, 504],
+                    allowed_methods=frozenset(["GET", "POST"]),
+                    raise_on_status=False,
+                ),
+            ))
+            _SESSION = session
+    return _SESSION
+
+# Firecrawl calls go over httpx so concurrent searches share one HTTP/2 connection
+_FC_CLIENT = None
+
+def _get_fc_client():
+    global _FC_CLIENT, httpx
+    with _CLIENT_LOCK:
+        if _FC_CLIENT is None:
+            import httpx
+            # a custom transport ignores the client's limits/http2, so they're set on the transport
+            _FC_CLIENT = httpx.Client(
+                timeout=30,
+                transport=httpx.HTTPTransport(
+                    http2=HAS_H2,
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                    retries=2,
+                ),
+            )
+    return _FC_CLIENT
+
+def _json_loads(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+# Error bodies can be whole HTML pages; only this much of one is ever read for the debug log
+FIRECRAWL_DEBUG_BYTES = 1000
+
+def _log_firecrawl_body(status_code: int, body):
+    """Debug-log the status and a truncated body (bytes or str); free when DEBUG is off."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    # truncate before decoding so a huge body is never decoded in full
+    body = (body or "")[:FIRECRAWL_DEBUG_BYTES]
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    logger.debug("Firecrawl status=%s body=%s", status_code, body.replace("\n", " "))
 
-def debug_print_firecrawl_response(resp: requests.Response):
+def _explain_firecrawl_status(status_code: int):
+    if status_code == 401 or status_code == 403:
+        logger.error("🔒 Authentication / permission error from Firecrawl (%s). Check your FIRECRAWL_API_KEY and account permissions.", status_code)
+    elif status_code == 429:
+        logger.warning("⏳ Rate limited by Firecrawl (429). Try again later or reduce request rate.")
+    else:
+        logger.warning("⚠️ Firecrawl returned non-200 status (%s).", status_code)
+
+# Only real absolute URLs count; a bare "http" prefix also matched ids like "httpbin-..."
+_URL_PREFIXES = ("http://", "https://")
+_startswith = str.startswith
+
+def _iter_urls(obj):
+    """Yield every http(s):// string in a decoded JSON value, depth-first in document order."""
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, dict):
+            stack.extend(reversed(list(x.values())))
+        elif isinstance(x, list):
+            stack.extend(reversed(x))
+        elif isinstance(x, str) and _startswith(x, _URL_PREFIXES):
+            yield x
+
+# Result containers in priority order, and the item fields that can hold a result's URL
+URL_CONTAINER_KEYS = ("results", "data", "items")
+URL_KEYS = ("url", "link", "target")
+
+def _item_url(item: dict):
+    """First truthy URL_KEYS field of a result item, or None."""
+    return next((u for k in URL_KEYS if (u := item.get(k))), None)
+
+def _firecrawl_urls(data, num_results: int) -> List[str]:
+    """Pull result URLs out of a decoded Firecrawl search response."""
+    # Look for results array in common shapes
+    # many Firecrawl responses include "results" as a list of dicts with "url"
+    for key in URL_CONTAINER_KEYS:
+        container = data.get(key)
+        if isinstance(container, list):
+            results = [u for it in container if isinstance(it, dict) and (u := _item_url(it))]
+            if results:
+                return results[:num_results]
+
+    # Fallback: top-level 'results' not found; attempt to find URLs anywhere in the JSON
+    # dedupe keeping order, and stop walking once we have enough
+    seen = set()
+    uniq = []
+    if num_results <= 0:
+        return uniq
+    for u in _iter_urls(data):
+        if u in seen:
+            continue
+        seen.add(u)
+        uniq.append(u)
+        if len(uniq) >= num_results:
+            break
+    return uniq
+
+_ITEM_PREFIXES = {f"{k}.item": k for k in URL_CONTAINER_KEYS}
+FIRECRAWL_CHUNK_BYTES = 8192
+
+class _FirecrawlUrlCollector:
+    """
+    Streaming counterpart of _firecrawl_urls, fed ijson (prefix, event, value) events.
+    Keeps at most num_results URLs per candidate list; `done` means the rest of the body can be skipped.
+    The first container to settle wins: a results/data/items list once it is full or closed, or
+    num_results URLs inside a "data" object (v2's data.web). Unlike _firecrawl_urls, a
+    higher-priority container appearing *after* that point is never read.
+    """
+
+    def __init__(self, num_results: int):
+        self.num_results = num_results
+        self.structured = {k: [] for k in URL_CONTAINER_KEYS}
+        self.generic: List[str] = []
+        self._seen = set()
+        self._item_prefix: Optional[str] = None
+        self._item: Optional[dict] = None
+        self._in_data_map = False
+        self.done = False
+
+    def feed(self, prefix: str, event: str, value: Any):
+        n = self.num_results
+        if event == "string":
+            if self._item is not None:
+                head, _, field = prefix.rpartition(".")
+                if head == self._item_prefix and field in URL_KEYS:
+                    self._item[field] = value
+            if len(self.generic) < n and _startswith(value, _URL_PREFIXES) and value not in self._seen:
+                self._seen.add(value)
+                self.generic.append(value)
+                if self._in_data_map and len(self.generic) >= n:
+                    self.done = True
+        elif event == "start_map" and self._item is None and prefix in _ITEM_PREFIXES:
+            self._item_prefix, self._item = prefix, {}
+        elif event == "start_map" and prefix == "data":
+            self._in_data_map = True
+        elif event == "end_map" and prefix == "data":
+            self._in_data_map = False
+        elif event == "end_map" and self._item is not None and prefix == self._item_prefix:
+            key = _ITEM_PREFIXES[prefix]
+            url = _item_url(self._item)
+            if url and len(self.structured[key]) < n:
+                self.structured[key].append(url)
+            self._item_prefix = self._item = None
+            if len(self.structured[key]) >= n:
+                self.done = True
+        elif event == "end_array" and prefix in URL_CONTAINER_KEYS and self.structured[prefix]:
+            self.done = True
+
+    def result(self) -> List[str]:
+        for key in URL_CONTAINER_KEYS:
+            if self.structured[key]:
+                return self.structured[key]
+        return self.generic
+
+def _drain_events(collector: _FirecrawlUrlCollector, events: list) -> bool:
+    for ev in events:
+        collector.feed(*ev)
+        if collector.done:
+            break
+    del events[:]
+    return collector.done
+
+def _iter_json_events(chunks):
+    """ijson (prefix, event, value) events for a body given as an iterable of byte chunks."""
+    events = ijson.sendable_list()
+    coro = ijson.parse_coro(events)
+    for chunk in chunks:
+        coro.send(chunk)
+        yield from events
+        del events[:]
+    coro.close()
+    yield from events
+
+def _stream_firecrawl_urls(chunks, num_results: int) -> List[str]:
+    """Parse a Firecrawl body from an iterable of byte chunks, stopping once the answer is known."""
+    collector = _FirecrawlUrlCollector(num_results)
+    for event in _iter_json_events(chunks):
+        collector.feed(*event)
+        if collector.done:
+            break
+    return collector.result()
+
+async def _astream_firecrawl_urls(chunks, num_results: int) -> List[str]:
+    """Async-iterator version of _stream_firecrawl_urls (aiohttp's iter_chunked)."""
+    collector = _FirecrawlUrlCollector(num_results)
+    events = ijson.sendable_list()
+    coro = ijson.parse_coro(events)
+    async for chunk in chunks:
+        coro.send(chunk)
+        if _drain_events(collector, events):
+            return collector.result()
+    coro.close()
+    _drain_events(collector, events)
+    return collector.result()
+
+def _firecrawl_post(query: str, site: str, limit: int, parse_stream, parse_data, default):
+    """
+    Blocking Firecrawl search call shared by firecrawl_search and firecrawl_first.
+    The body goes to parse_stream (byte chunks) when ijson is installed, else parse_data
+    (decoded JSON). Any failure is logged and returns `default`.
+    """
+    if not FIRECRAWL_API_KEY:
+        logger.warning("⚠️ FIRECRAWL_API_KEY not set in environment.")
+        return default
+
+    payload = {"query": _site_query(query, site), "limit": limit}
+
+    try:
+        with _get_fc_client().stream("POST", FIRECRAWL_SEARCH_URL, json=payload, headers=_FC_HEADERS) as resp:
+            # If non-200, log the head of the body and return empty so caller falls back
+            if resp.status_code != 200:
+                if logger.isEnabledFor(logging.DEBUG):
+                    _log_firecrawl_body(resp.status_code, next(resp.iter_bytes(FIRECRAWL_DEBUG_BYTES), b""))
+                _explain_firecrawl_status(resp.status_code)
+                return default
+            if ijson is not None:
+                try:
+                    return parse_stream(resp.iter_bytes(FIRECRAWL_CHUNK_BYTES))
+                except httpx.HTTPError:
+                    raise
+                except Exception as e:
+                    logger.warning("⚠️ Failed to parse Firecrawl JSON: %s", e)
+                    return default
+            body = resp.read()
+    except Exception as e:
+        logger.warning("⚠️ Network error calling Firecrawl: %s", e)
+        return default
+
+    # try to parse JSON
     try:
-        print("Firecrawl status:", resp.status_code)
-        # print a truncated body to avoid huge logs
-        text = resp.text or ""
-        print("Firecrawl response (first 1000 chars):", text[:1000].replace("\n", " "))
+        data = _json_loads(body)
     except Exception as e:
-        print("Could not print Firecrawl response:", e)
+        logger.warning("⚠️ Failed to parse Firecrawl JSON: %s", e)
+        _log_firecrawl_body(200, body)
+        return default
+
+    return parse_data(data)
 
 def firecrawl_search(query: str, site: str = "", num_results: int = 5) -> List[str]:
     """
@@ -27,134 +347,470 @@ def firecrawl_search(query: str, site: str = "", num_results: int = 5) -> List[s
     Returns a list of URLs (strings).
     If Firecrawl fails, returns an empty list (caller should fallback).
     """
+    return _firecrawl_post(
+        query, site, num_results,
+        lambda chunks: _stream_firecrawl_urls(chunks, num_results),
+        lambda data: _firecrawl_urls(data, num_results),
+        [],
+    )
+
+def _first_url_streamed(chunks) -> Optional[str]:
+    """First http(s) url/link/target value in the body, else its first http(s) string at all."""
+    fallback = None
+    for prefix, event, value in _iter_json_events(chunks):
+        if event == "string" and _startswith(value, _URL_PREFIXES):
+            if prefix.rpartition(".")[2] in URL_KEYS:
+                return value
+            if fallback is None:
+                fallback = value
+    return fallback
+
+def _first_url(data) -> Optional[str]:
+    urls = _firecrawl_urls(data, 1)
+    return urls[0] if urls else None
+
+def firecrawl_first(query: str, site: str = "") -> Optional[str]:
+    """
+    Top Firecrawl result only (limit=1). With ijson the body is read just until the first
+    url/link/target field, instead of collecting and deduping a result list. None on failure.
+    """
+    return _firecrawl_post(query, site, 1, _first_url_streamed, _first_url, None)
+
+# -------------------------
+# DuckDuckGo fallback search (HTML)
+# -------------------------
+# DuckDuckGo HTML returns results in <a class="result__a" href="...">
+_DDG_RESULT_CSS = "a.result__a[href]"
+bs4 = None  # imported on first use by _ddg_result_hrefs
+_DDG_RESULT_XPATH = '//a[contains(concat(" ", normalize-space(@class), " "), " result__a ")]/@href'
+
+def _ddg_result_hrefs(html: str) -> List[str]:
+    """hrefs of the result links only (no nav/footer anchors)."""
+    if not html or not html.strip():
+        return []
+    if LexborHTMLParser is not None:
+        return [node.attributes.get("href") or "" for node in LexborHTMLParser(html).css(_DDG_RESULT_CSS)]
+    if lxml_html is not None:
+        return lxml_html.fromstring(html).xpath(_DDG_RESULT_XPATH)
+    # last resort, so bs4 is only imported when neither fast parser is installed
+    global bs4
+    if bs4 is None:
+        import bs4
+    try:
+        soup = bs4.BeautifulSoup(html, "lxml")
+    except bs4.FeatureNotFound:
+        soup = bs4.BeautifulSoup(html, "html.parser")
+    return [a["href"] for a in soup.select(_DDG_RESULT_CSS)]
+
+def _unwrap_ddg_href(href: str) -> str:
+    """Result links may point at DDG's redirector (//duckduckgo.com/l/?uddg=<target>)."""
+    if "uddg=" not in href:
+        return href
+    target = urllib.parse.parse_qs(urllib.parse.urlparse(href).query).get("uddg")
+    return target[0] if target else href
+
+def _iter_ddg_links(html: str):
+    """Unique external result URLs, in page order."""
+    seen = set()
+    for href in _ddg_result_hrefs(html):
+        href = _unwrap_ddg_href(href)
+        # internal ("/...") links are skipped by the http check
+        if _startswith(href, _URL_PREFIXES) and href not in seen:
+            seen.add(href)
+            yield href
+
+def _ddg_links(html: str, num_results: int) -> List[str]:
+    return list(itertools.islice(_iter_ddg_links(html), max(num_results, 0)))
+
+DDG_HTML_URL = "https://html.duckduckgo.com/html/"
+DDG_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+}
+
+def ddg_search(query: str, num_results: int = 5) -> List[str]:
+    """
+    Simple DuckDuckGo HTML search fallback.
+    Uses the lightweight HTML endpoint to avoid heavy JS.
+    """
+    params = {"q": query}
+    try:
+        resp = _get_session().post(DDG_HTML_URL, data=params, headers=DDG_HEADERS, timeout=15)
+        resp.raise_for_status()
+    except Exception as e:
+        logger.warning("⚠️ DuckDuckGo search failed: %s", e)
+        return []
+
+    return _ddg_links(resp.text, num_results)
+
+# -------------------------
+# Async backends (aiohttp) for racing Firecrawl against DuckDuckGo
+# -------------------------
+# Give Firecrawl this long on its own before also starting DuckDuckGo
+FIRECRAWL_HEDGE_SECONDS = float(os.getenv("FIRECRAWL_HEDGE_SECONDS", "2.0"))
+# Concurrent Firecrawl calls arriving within this window are sent out together (up to FIRECRAWL_BATCH_SIZE)
+FIRECRAWL_BATCH_WINDOW = float(os.getenv("FIRECRAWL_BATCH_WINDOW", "0.005"))
+FIRECRAWL_BATCH_SIZE = int(os.getenv("FIRECRAWL_BATCH_SIZE", "16"))
+
+_aio_session = None
+_aio_loop = None
+
+def _get_aio_session():
+    """One aiohttp session per event loop (sessions can't be shared across loops)."""
+    global _aio_session, _aio_loop, aiohttp
+    if aiohttp is None:
+        import aiohttp
+    loop = asyncio.get_running_loop()
+    if _aio_session is None or _aio_session.closed or _aio_loop is not loop:
+        _aio_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300))
+        _aio_loop = loop
+    return _aio_session
+
+async def close_search_session():
+    """Close the shared aiohttp session. Call once before the event loop exits."""
+    global _aio_session, _aio_loop, _batcher, _batcher_loop
+    _batcher = _batcher_loop = None
+    try:
+        if _aio_session is not None and _aio_loop is asyncio.get_running_loop():
+            await _aio_session.close()
+    finally:
+        _aio_session = None
+        _aio_loop = None
+
+async def firecrawl_search_async(query: str, site: str = "", num_results: int = 5) -> List[str]:
+    """Async firecrawl_search. Returns [] on any failure so the caller can fall back."""
+    if not HAS_AIOHTTP:
+        return await asyncio.to_thread(firecrawl_search, query, site, num_results)
     if not FIRECRAWL_API_KEY:
-        print("⚠️ FIRECRAWL_API_KEY not set in environment.")
+        logger.warning("⚠️ FIRECRAWL_API_KEY not set in environment.")
         return []
 
-    q = f"site:{site} {query}" if site else query
-    headers = {"Authorization": f"Bearer {FIRECRAWL_API_KEY}", "Content-Type": "application/json"}
-    payload = {"query": q, "limit": num_results}
+    payload = {"query": _site_query(query, site), "limit": num_results}
 
     try:
-        resp = requests.post(FIRECRAWL_SEARCH_URL, json=payload, headers=headers, timeout=30)
+        async with _get_aio_session().post(
+            FIRECRAWL_SEARCH_URL, json=payload, headers=_FC_HEADERS, timeout=aiohttp.ClientTimeout(total=30)
+        ) as resp:
+            status = resp.status
+            if status != 200:
+                debug = logger.isEnabledFor(logging.DEBUG)
+                body = await resp.content.read(FIRECRAWL_DEBUG_BYTES) if debug else b""
+            elif ijson is not None:
+                try:
+                    return await _astream_firecrawl_urls(resp.content.iter_chunked(FIRECRAWL_CHUNK_BYTES), num_results)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    raise
+                except Exception as e:
+                    logger.warning("⚠️ Failed to parse Firecrawl JSON: %s", e)
+                    return []
+            else:
+                body = await resp.read()
     except Exception as e:
-        print("⚠️ Network error calling Firecrawl:", e)
+        logger.warning("⚠️ Network error calling Firecrawl: %s", e)
         return []
 
-    # If non-200, print debug info and return empty so caller falls back
-    if resp.status_code != 200:
-        debug_print_firecrawl_response(resp)
-        if resp.status_code == 401 or resp.status_code == 403:
-            print("🔒 Authentication / permission error from Firecrawl. Check your FIRECRAWL_API_KEY and account permissions.")
-        elif resp.status_code == 429:
-            print("⏳ Rate limited by Firecrawl (429). Try again later or reduce request rate.")
-        else:
-            print("⚠️ Firecrawl returned non-200 status.")
+    if status != 200:
+        _log_firecrawl_body(status, body)
+        _explain_firecrawl_status(status)
         return []
 
-    # try to parse JSON
     try:
-        data = resp.json()
+        data = _json_loads(body)
     except Exception as e:
-        print("⚠️ Failed to parse Firecrawl JSON:", e)
-        debug_print_firecrawl_response(resp)
+        logger.warning("⚠️ Failed to parse Firecrawl JSON: %s", e)
+        _log_firecrawl_body(status, body)
         return []
 
-    # Look for results array in common shapes
-    results = []
-    # many Firecrawl responses include "results" as a list of dicts with "url"
-    for key in ("results", "data", "items"):
-        if isinstance(data.get(key), list):
-            for it in data.get(key, []):
-                if isinstance(it, dict):
-                    url = it.get("url") or it.get("link") or it.get("target")
-                    if url:
-                        results.append(url)
-            if results:
-                return results[:num_results]
+    return _firecrawl_urls(data, num_results)
 
-    # Fallback: top-level 'results' not found; attempt to find URLs anywhere in the JSON
-    def extract_urls_from_obj(obj):
-        found = []
-        if isinstance(obj, dict):
-            for v in obj.values():
-                found += extract_urls_from_obj(v)
-        elif isinstance(obj, list):
-            for v in obj:
-                found += extract_urls_from_obj(v)
-        elif isinstance(obj, str):
-            if obj.startswith("http"):
-                found.append(obj)
-        return found
-
-    extracted = extract_urls_from_obj(data)
-    # dedupe keeping order
-    uniq = []
-    seen = set()
-    for u in extracted:
-        if u not in seen:
-            seen.add(u)
-            uniq.append(u)
-    return uniq[:num_results]
+class _FirecrawlBatcher:
+    """
+    Smart batching for firecrawl_search_async: queued calls are drained up to max_batch at a time,
+    waiting at most `window` seconds for company, and sent concurrently over the shared session.
+    Identical (query, site, num_results) calls in a batch share one request.
+    """
+
+    def __init__(self, max_batch: int = FIRECRAWL_BATCH_SIZE, window: float = FIRECRAWL_BATCH_WINDOW):
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self._queue: "deque[Tuple[tuple, asyncio.Future]]" = deque()
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight = set()
+
+    async def submit(self, query: str, site: str, num_results: int) -> List[str]:
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.append(((query, site, num_results), fut))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return await fut
+
+    async def _run(self):
+        while self._queue:
+            if len(self._queue) < self.max_batch:
+                await asyncio.sleep(self.window)
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            # don't hold the next batch back while this one is on the wire
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        groups: Dict[tuple, list] = {}
+        for key, fut in batch:
+            if not fut.done():  # caller already gave up (e.g. lost the DuckDuckGo race)
+                groups.setdefault(key, []).append(fut)
+        tasks = {key: asyncio.create_task(firecrawl_search_async(*key)) for key in groups}
+        for key, futs in groups.items():
+            for fut in futs:
+                fut.add_done_callback(lambda _f, t=tasks[key], fs=futs: self._abandon_if_unwanted(t, fs))
+
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for futs, res in zip(groups.values(), results):
+            for fut in futs:
+                if fut.done():
+                    continue
+                if isinstance(res, BaseException):
+                    fut.set_exception(res)
+                else:
+                    fut.set_result(list(res))
+
+    @staticmethod
+    def _abandon_if_unwanted(task: asyncio.Task, futs: list):
+        # every caller waiting on this request was cancelled: free the connection
+        if all(f.cancelled() for f in futs):
+            task.cancel()
+
+_batcher: Optional[_FirecrawlBatcher] = None
+_batcher_loop = None
+
+async def firecrawl_search_batched(query: str, site: str = "", num_results: int = 5) -> List[str]:
+    """firecrawl_search_async routed through the per-event-loop batcher."""
+    global _batcher, _batcher_loop
+    if not HAS_AIOHTTP:
+        return await firecrawl_search_async(query, site, num_results)
+    loop = asyncio.get_running_loop()
+    if _batcher is None or _batcher_loop is not loop:
+        _batcher = _FirecrawlBatcher()
+        _batcher_loop = loop
+    return await _batcher.submit(query, site, num_results)
+
+async def ddg_search_async(query: str, num_results: int = 5) -> List[str]:
+    """Async ddg_search."""
+    if not HAS_AIOHTTP:
+        return await asyncio.to_thread(ddg_search, query, num_results)
+    try:
+        async with _get_aio_session().post(
+            DDG_HTML_URL, data={"q": query}, headers=DDG_HEADERS, timeout=aiohttp.ClientTimeout(total=15)
+        ) as resp:
+            resp.raise_for_status()
+            html = await resp.text()
+    except Exception as e:
+        logger.warning("⚠️ DuckDuckGo search failed: %s", e)
+        return []
+    return _ddg_links(html, num_results)
 
 # -------------------------
-# DuckDuckGo fallback search (HTML)
+# In-process result cache: (normalized query, site, num_results) -> URLs, for SEARCH_CACHE_TTL seconds
 # -------------------------
-def ddg_search(query: str, num_results: int = 5) -> List[str]:
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_SIZE = 1024
+
+class _TTLCache:
+    """Minimal stand-in for cachetools.TTLCache (LRU + per-entry expiry)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+_search_cache = (TTLCache or _TTLCache)(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+_search_cache_lock = threading.Lock()
+
+def _search_cache_key(query: str, site: str, num_results: int):
+    return (query.strip().lower(), (site or "").strip().lower(), num_results)
+
+def _search_cache_get(key) -> Optional[List[str]]:
+    with _search_cache_lock:
+        hit = _search_cache.get(key)
+    return list(hit) if hit is not None else None
+
+def _search_cache_put(key, results: List[str]):
+    if results:
+        with _search_cache_lock:
+            _search_cache[key] = list(results)
+
+# Paraphrase layer behind the exact cache: only active when sentence-transformers is installed
+SEMANTIC_SEARCH_THRESHOLD = float(os.getenv("SEMANTIC_SEARCH_THRESHOLD", "0.85"))
+_semantic_cache = SemanticCache(
+    directory=None,
+    ttl=SEARCH_CACHE_TTL,
+    threshold=SEMANTIC_SEARCH_THRESHOLD,
+    max_entries=SEARCH_CACHE_SIZE,
+    embedding_dtype="float16",
+)
+
+def _semantic_scope(query: str, key) -> str:
+    # site, num_results and the query's numbers: "under 50k" never reuses "under 80k"
+    return f"{key[1]}:{key[2]}:{query_numbers(query)}"
+
+def _semantic_lookup(query: str, key) -> Tuple[Optional[List[str]], Any]:
     """
-    Simple DuckDuckGo HTML search fallback.
-    Uses the lightweight HTML endpoint to avoid heavy JS.
+    (paraphrase hit for `key`'s site/num_results, promoted into the exact cache; or None,
+    query embedding to pass on to _cache_results; or None).
     """
-    url = "https://html.duckduckgo.com/html/"
-    params = {"q": query}
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-    }
+    if not _semantic_cache.semantic_enabled:
+        return None, None
     try:
-        resp = requests.post(url, data=params, headers=headers, timeout=15)
-        resp.raise_for_status()
+        similar, embedding = _semantic_cache.lookup(query, _semantic_scope(query, key))
     except Exception as e:
-        print("⚠️ DuckDuckGo search failed:", e)
-        return []
+        logger.warning("⚠️ Semantic cache lookup failed: %s", e)
+        return None, None
+    if not similar:
+        return None, embedding
+    _search_cache_put(key, similar)
+    return list(similar), embedding
 
-    soup = BeautifulSoup(resp.text, "html.parser")
-    links = []
-    # DuckDuckGo HTML returns results in <a class="result__a" href="...">
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        # ignore internal links
-        if href.startswith("/"):
-            continue
-        if href.startswith("http"):
-            links.append(href)
-        if len(links) >= num_results:
-            break
+def _cache_results(query: str, key, results: List[str], embedding: Any = None):
+    _search_cache_put(key, results)
+    if results and _semantic_cache.semantic_enabled:
+        try:
+            _semantic_cache.set(query, list(results), _semantic_scope(query, key), embedding)
+        except Exception as e:
+            logger.warning("⚠️ Semantic cache store failed: %s", e)
 
-    # dedupe
-    uniq = []
-    seen = set()
-    for u in links:
-        if u not in seen:
-            seen.add(u)
-            uniq.append(u)
-    return uniq[:num_results]
+async def search_all_async(query: str, site: str = "", num_results: int = 5) -> List[str]:
+    """
+    Firecrawl first; if it hasn't answered within FIRECRAWL_HEDGE_SECONDS, DuckDuckGo is
+    started alongside it and the first non-empty result wins (the other request is cancelled).
+    Non-empty results are cached for SEARCH_CACHE_TTL seconds, exact-match first and then
+    by query-embedding similarity.
+    """
+    key = _search_cache_key(query, site, num_results)
+    cached = _search_cache_get(key)
+    if cached is not None:
+        return cached
+
+    embedding = None
+    if _semantic_cache.semantic_enabled:
+        similar, embedding = await asyncio.to_thread(_semantic_lookup, query, key)
+        if similar:
+            return similar
+
+    results = await _search_all_uncached(query, site, num_results)
+    if _semantic_cache.semantic_enabled:
+        await asyncio.to_thread(_cache_results, query, key, results, embedding)
+    else:
+        _cache_results(query, key, results)
+    return results
+
+async def _search_all_uncached(query: str, site: str, num_results: int) -> List[str]:
+    ddg_query = _site_query(query, site)
+    fc = asyncio.create_task(firecrawl_search_batched(query, site, num_results))
+    done, _ = await asyncio.wait({fc}, timeout=FIRECRAWL_HEDGE_SECONDS)
+    if done:
+        results = fc.result()
+        if results:
+            return results
+        # If Firecrawl failed, fallback to DuckDuckGo
+        logger.warning("⚠️ Falling back to DuckDuckGo HTML search (Firecrawl failed).")
+        return await ddg_search_async(ddg_query, num_results=num_results)
+
+    logger.warning("⚠️ Firecrawl is slow; racing DuckDuckGo HTML search.")
+    ddg = asyncio.create_task(ddg_search_async(ddg_query, num_results=num_results))
+    pending = {fc, ddg}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # if both land together, prefer Firecrawl's ranking
+            for task in sorted(done, key=lambda t: t is not fc):
+                if task.result():
+                    return task.result()
+        return []
+    finally:
+        for task in pending:
+            task.cancel()
 
 # -------------
 # Public API-compatible wrappers
 # -------------
+# Blocking searches hedge on threads so they reuse the pooled _FC_CLIENT/_SESSION connections
+# (an asyncio.run per call would build and tear down an aiohttp session every time)
+_SYNC_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="web_search")
+
+def _search_all_blocking(query: str, site: str, num_results: int) -> List[str]:
+    """Thread-based twin of _search_all_uncached over firecrawl_search / ddg_search."""
+    ddg_query = _site_query(query, site)
+    fc = _SYNC_POOL.submit(firecrawl_search, query, site, num_results)
+    try:
+        results = fc.result(timeout=FIRECRAWL_HEDGE_SECONDS)
+    except concurrent.futures.TimeoutError:
+        pass
+    else:
+        if results:
+            return results
+        # If Firecrawl failed, fallback to DuckDuckGo
+        logger.warning("⚠️ Falling back to DuckDuckGo HTML search (Firecrawl failed).")
+        return ddg_search(ddg_query, num_results=num_results)
+
+    logger.warning("⚠️ Firecrawl is slow; racing DuckDuckGo HTML search.")
+    ddg = _SYNC_POOL.submit(ddg_search, ddg_query, num_results)
+    pending = {fc, ddg}
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        # if both land together, prefer Firecrawl's ranking; the loser finishes in the background
+        for fut in sorted(done, key=lambda f: f is not fc):
+            if fut.result():
+                return fut.result()
+    return []
+
 def search_all(query: str, site: str = "", num_results: int = 5) -> List[str]:
-    # Try Firecrawl first
-    fc = firecrawl_search(query, site, num_results)
-    if fc:
-        return fc
-    # If Firecrawl failed, fallback to DuckDuckGo
-    print("⚠️ Falling back to DuckDuckGo HTML search (Firecrawl failed).")
-    ddg = ddg_search(f"{'site:' + site + ' ' if site else ''}{query}", num_results=num_results)
-    return ddg
+    """Blocking counterpart of search_all_async: same hedging and caching, on a thread pool."""
+    key = _search_cache_key(query, site, num_results)
+    cached = _search_cache_get(key)
+    if cached is not None:
+        return cached
+    similar, embedding = _semantic_lookup(query, key)
+    if similar:
+        return similar
+
+    results = _search_all_blocking(query, site, num_results)
+    _cache_results(query, key, results, embedding)
+    return results
 
 def main(query: str, site: str = "", num_results: int = 1) -> Optional[str]:
-    results = search_all(query, site, num_results)
-    return results[0] if results else None
+    if num_results != 1:
+        results = search_all(query, site, num_results)
+        return results[0] if results else None
+
+    # top result only: a cached answer, else Firecrawl's first URL, else DuckDuckGo's
+    key = _search_cache_key(query, site, 1)
+    cached = _search_cache_get(key)
+    if cached:
+        return cached[0]
+    url = firecrawl_first(query, site)
+    if not url:
+        logger.warning("⚠️ Falling back to DuckDuckGo HTML search (Firecrawl failed).")
+        results = ddg_search(_site_query(query, site), 1)
+        url = results[0] if results else None
+    if url:
+        _search_cache_put(key, [url])
+    return url
 
 # quick CLI test
 if __name__ == "__main__":